@@ -1,8 +1,30 @@
 import os
+import sys
+import time
+import codecs
+import gzip
+import hashlib
 import json
+import posixpath
+import tarfile
+import queue
+import atexit
+import socket
+import functools
+import threading
 import requests
 import logging
-from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from urllib3.util.retry import Retry
+
+try:
+    import orjson # Optional: faster JSON encode/decode when installed
+except ImportError:
+    orjson = None
 
 # --- Configuration ---
 # Load configuration from environment variables
@@ -13,50 +35,191 @@ BITBUCKET_REPO_SLUG = os.environ.get("BITBUCKET_REPO_SLUG")
 BITBUCKET_ACCESS_TOKEN = os.environ.get("BITBUCKET_ACCESS_TOKEN") # Needs repo:read scope
 BITBUCKET_BRANCH_OR_COMMIT = os.environ.get("BITBUCKET_BRANCH_OR_COMMIT", "main") # Default to 'main' branch
 RULES_DIR = os.environ.get("RULES_DIR", "rules").strip('/') # Remove leading/trailing slashes
-
-# --- Validation ---
-if not all([ACCESS_TOKEN, REGION]):
-    raise ValueError("Missing required Chronicle environment variables: CHRONICLE_ACCESS_TOKEN, CHRONICLE_REGION")
-if not all([BITBUCKET_WORKSPACE, BITBUCKET_REPO_SLUG, BITBUCKET_ACCESS_TOKEN]):
-    raise ValueError("Missing required Bitbucket environment variables: BITBUCKET_WORKSPACE, BITBUCKET_REPO_SLUG, BITBUCKET_ACCESS_TOKEN")
+BITBUCKET_FETCH_MODE = os.environ.get("BITBUCKET_FETCH_MODE", "api").lower() # 'api' (list + per-file GETs) or 'archive' (single tarball)
+CI_CACHE_DIR = os.environ.get("CI_CACHE_DIR") # Optional: directory for the Chronicle ruleName cache; caching is off if unset
+CACHE_TTL_RAW = os.environ.get("CACHE_TTL", "300") # Max age in seconds of a cached ruleName listing; parsed into CACHE_TTL by configure()
+SKIP_PRE_VERIFY = os.environ.get("SKIP_PRE_VERIFY", "1") != "0" # Set to 0 to call verifyRule before each upload
+GZIP_REQUEST_BODIES = os.environ.get("GZIP_REQUEST_BODIES", "0") == "1" # Set to 1 to gzip JSON request bodies larger than 1 KiB
 
 # --- API URLs and Headers ---
-CHRONICLE_BASE_API_URL = f"https://{REGION}-backstory.googleapis.com/v2"
+# CHRONICLE_BASE_API_URL and the headers depend on validated configuration and are set by configure()
+CHRONICLE_BASE_API_URL = None
 BITBUCKET_BASE_API_URL = "https://api.bitbucket.org/2.0"
+BITBUCKET_WEB_URL = "https://bitbucket.org"
+
+CHRONICLE_HEADERS = None
+BITBUCKET_HEADERS = None
+CACHE_TTL = None
+
+# Request bodies at or below this size are sent uncompressed even when GZIP_REQUEST_BODIES is set
+GZIP_MIN_BODY_BYTES = 1024
+
+# --- HTTP Sessions ---
+# One pooled Session per host so keep-alive connections (and their TLS
+# handshakes) are reused across the many list/fetch/verify/upload calls.
+# POST is deliberately not retried: createRule is not idempotent.
+HTTP_POOL_MAXSIZE = 32
+
+def _fetch_worker_count():
+    """
+    Sizes the Bitbucket content-fetch pool from the CPUs this process may run
+    on (4 I/O-bound threads per CPU, at least 4), capped at the connection
+    pool size so worker threads never wait on (or discard) pooled connections.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    return min(max(4, cpus * 4), HTTP_POOL_MAXSIZE)
+
+# Concurrent Bitbucket file-content fetches. ThreadPoolExecutor only starts
+# threads as tasks arrive, so small rule directories never spawn the full pool.
+BITBUCKET_FETCH_WORKERS = _fetch_worker_count()
+# Concurrent Chronicle verify/upload chains; bounded to stay within Chronicle rate limits.
+CHRONICLE_DEPLOY_WORKERS = 10
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets set TCP_NODELAY and SO_KEEPALIVE."""
+    # urllib3's defaults already include TCP_NODELAY; SO_KEEPALIVE stops idle
+    # pooled connections from being silently dropped between calls.
+    socket_options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _build_session(headers):
+    """Creates a requests Session with connection pooling and retries on transient errors."""
+    session = requests.Session()
+    retries = Retry(
+        total=5,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+        raise_on_status=False,
+    )
+    adapter = _KeepAliveAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retries)
+    session.mount("https://", adapter)
+    session.headers.update(headers)
+    return session
+
+@functools.lru_cache(maxsize=1)
+def get_chronicle_session():
+    """Returns the shared Chronicle Session, creating it on first use. Requires configure()."""
+    return _build_session(CHRONICLE_HEADERS)
+
+
+@functools.lru_cache(maxsize=1)
+def get_bitbucket_session():
+    """Returns the shared Bitbucket Session, creating it on first use. Requires configure()."""
+    return _build_session(BITBUCKET_HEADERS)
+
+# --- Setup ---
+
+# Background thread that writes queued log records; started once by configure()
+_log_listener = None
+
+def _configure_logging():
+    """
+    Routes log records through a queue to a background thread that formats
+    and writes them, so worker threads never block on stderr writes.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+    # Flushes any queued records on interpreter exit
+    atexit.register(_log_listener.stop)
+
+
+def configure():
+    """
+    Validates the environment configuration, builds the API URL and headers,
+    and sets up logging. Called from main() so importing this module has no
+    side effects.
+    """
+    global CHRONICLE_BASE_API_URL, CHRONICLE_HEADERS, BITBUCKET_HEADERS, CACHE_TTL
 
-CHRONICLE_HEADERS = {
-    "Authorization": f"Bearer {ACCESS_TOKEN}",
-    "Content-Type": "application/json",
-    "Accept": "application/json",
-}
-BITBUCKET_HEADERS = {
-    "Authorization": f"Bearer {BITBUCKET_ACCESS_TOKEN}",
-    "Accept": "application/json",
-}
+    _configure_logging()
 
-# --- Logging Setup ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not all([ACCESS_TOKEN, REGION]):
+        raise ValueError("Missing required Chronicle environment variables: CHRONICLE_ACCESS_TOKEN, CHRONICLE_REGION")
+    if not all([BITBUCKET_WORKSPACE, BITBUCKET_REPO_SLUG, BITBUCKET_ACCESS_TOKEN]):
+        raise ValueError("Missing required Bitbucket environment variables: BITBUCKET_WORKSPACE, BITBUCKET_REPO_SLUG, BITBUCKET_ACCESS_TOKEN")
+    try:
+        CACHE_TTL = int(CACHE_TTL_RAW)
+        if CACHE_TTL < 0:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"Invalid CACHE_TTL environment variable: {CACHE_TTL_RAW!r}. Expected a non-negative number of seconds.") from None
+
+    CHRONICLE_BASE_API_URL = f"https://{REGION}-backstory.googleapis.com/v2"
+    CHRONICLE_HEADERS = {
+        "Authorization": f"Bearer {ACCESS_TOKEN}",
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+    BITBUCKET_HEADERS = {
+        "Authorization": f"Bearer {BITBUCKET_ACCESS_TOKEN}",
+        "Accept": "application/json",
+    }
 
 # --- Helper Functions ---
 
-def _make_api_request(method, url, headers, params=None, json_data=None, expected_status=200, stream=False):
-    """Helper function to make generic API requests with error handling."""
+def _json_loads(data):
+    """Decodes JSON from bytes or str, using orjson when available."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj):
+    """Encodes obj as UTF-8 JSON bytes, using orjson when available."""
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode('utf-8')
+
+
+def _make_api_request(session, method, url, headers=None, params=None, json_data=None, expected_status=200, stream=False, passthrough_statuses=()):
+    """
+    Helper function to make generic API requests with error handling.
+    Responses with a status in passthrough_statuses are not treated as errors;
+    their decoded JSON body is returned for the caller to inspect.
+    """
+    data = None
+    if json_data is not None:
+        # Serialize once here rather than letting requests re-encode with the stdlib
+        data = _json_dumps(json_data)
+        headers = {**(headers or {}), "Content-Type": "application/json"}
+        if GZIP_REQUEST_BODIES and len(data) > GZIP_MIN_BODY_BYTES:
+            data = gzip.compress(data, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
     try:
-        response = requests.request(method, url, headers=headers, params=params, json=json_data, stream=stream)
+        response = session.request(method, url, headers=headers, params=params, data=data, stream=stream)
+        if response.status_code in passthrough_statuses:
+            return _json_loads(response.content)
         if response.status_code != expected_status:
             error_details = f"Status: {response.status_code}."
             try:
-                error_body = response.json()
-                error_details += f" Body: {json.dumps(error_body)}"
+                error_body = _json_loads(response.content)
+                error_details += f" Body: {_json_dumps(error_body).decode('utf-8')}"
             except json.JSONDecodeError:
                 error_details += f" Body: {response.text}"
             logging.error(f"API Request Error ({method} {url}): Unexpected status code. {error_details}")
             response.raise_for_status()
 
+        # Streamed responses are returned unread; the caller consumes and closes them
+        if stream:
+            return response
+
         if response.status_code == 204 or not response.content:
-             return None if not stream else response
+             return None
 
-        return response.content if stream else response.json()
+        return _json_loads(response.content)
 
     except requests.exceptions.RequestException as e:
         logging.error(f"API Request Error ({method} {url}): {e}")
@@ -73,107 +236,326 @@ def _make_api_request(method, url, headers, params=None, json_data=None, expecte
         return None
 
 
-def get_files_from_bitbucket():
-    """Fetches rule files from the specified directory in Bitbucket via API."""
+def _filename_stem(file_path):
+    """Returns the final path component of file_path without its extension (same as Path(file_path).stem)."""
+    file_name = file_path[file_path.rfind('/') + 1:]
+    dot = file_name.rfind('.')
+    return file_name[:dot] if dot > 0 else file_name
+
+
+def _decode_utf8_chunks(chunks):
+    """Decodes an iterable of UTF-8 byte chunks into a str without joining the raw bytes first."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parts = [decoder.decode(chunk) for chunk in chunks]
+    parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts)
+
+
+def _fetch_rule_text(file_content_url):
+    """Downloads a single rule file from Bitbucket and decodes it as UTF-8. Returns None if the request failed."""
+    response = _make_api_request(get_bitbucket_session(), "GET", file_content_url, stream=True)
+    if response is None:
+        return None
+    try:
+        return _decode_utf8_chunks(response.iter_content(chunk_size=65536))
+    finally:
+        response.close()
+
+
+def _append_rule_file(rule_files_content, file_path, filename_stem, load_rule_text):
+    """
+    Calls load_rule_text() to obtain the decoded rule file content and appends
+    it to rule_files_content if usable. load_rule_text returns None when the
+    file could not be fetched. Returns the appended rule dict, or None.
+    """
+    try:
+        rule_text = load_rule_text()
+        if rule_text is None:
+            logging.error(f"Failed to fetch content for rule file: {file_path}")
+        elif rule_text.strip():
+             # Store the filename_stem as 'name' for matching
+             rule_data = {'name': filename_stem, 'text': rule_text, 'path': file_path}
+             rule_files_content.append(rule_data)
+             logging.debug(f"Successfully fetched content for {file_path}")
+             return rule_data
+        else:
+            logging.warning(f"Rule file '{file_path}' is empty. Skipping.")
+    except UnicodeDecodeError:
+         logging.error(f"Could not decode content of file '{file_path}' as UTF-8. Skipping.")
+    except Exception as e:
+         logging.error(f"Error processing content of file '{file_path}': {e}. Skipping.")
+    return None
+
+
+def _get_files_from_bitbucket_archive(existing_rule_names, on_rule_file=None):
+    """
+    Fetches rule files by streaming a single tarball of the ref and reading
+    RULES_DIR from it. Returns (rule_files_content, rules_skipped).
+    """
+    archive_url = f"{BITBUCKET_WEB_URL}/{BITBUCKET_WORKSPACE}/{BITBUCKET_REPO_SLUG}/get/{BITBUCKET_BRANCH_OR_COMMIT}.tar.gz"
+    logging.info(f"Downloading repository archive from Bitbucket: {archive_url}")
+    response = _make_api_request(get_bitbucket_session(), "GET", archive_url, headers={"Accept": "*/*"}, stream=True)
+    if response is None:
+        logging.error("Failed to download repository archive from Bitbucket. Check permissions and branch/commit.")
+        return None, 0
+
+    rule_files_content = []
+    rules_skipped = 0
+    try:
+        # Undo any transport Content-Encoding so tarfile only sees the gzip stream
+        response.raw.decode_content = True
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as tf:
+            for member in tf:
+                # Archive entries are prefixed with a '<workspace>-<repo>-<hash>/' directory
+                _, _, file_path = member.name.partition('/')
+                # Match the API listing: only files directly inside RULES_DIR
+                if not member.isfile() or not file_path.endswith('.yaral') or posixpath.dirname(file_path) != RULES_DIR:
+                    continue
+                filename_stem = _filename_stem(file_path)
+                logging.info(f"Found rule file: {file_path}")
+                if filename_stem in existing_rule_names:
+                    logging.info(f"Rule with matching ruleName '{filename_stem}' found in Chronicle. Skipping upload.")
+                    rules_skipped += 1
+                    continue
+                # Read the member here rather than inside _append_rule_file, so a
+                # broken download aborts the whole archive instead of skipping one file
+                member_file = tf.extractfile(member)
+                member_chunks = list(iter(lambda: member_file.read(65536), b''))
+                _append_rule_file(rule_files_content, file_path, filename_stem,
+                                  lambda: _decode_utf8_chunks(member_chunks))
+    # response.raw is the urllib3 stream, so read failures surface as urllib3 errors
+    except (tarfile.TarError, requests.exceptions.RequestException, Urllib3HTTPError) as e:
+        logging.error(f"Failed to read repository archive from Bitbucket: {e}")
+        return None, rules_skipped
+    finally:
+        response.close()
+
+    logging.info(f"Finished fetching files from Bitbucket archive. Found {len(rule_files_content)} new rule files ({rules_skipped} already in Chronicle).")
+    # Only hand rules on once the whole archive has been read successfully
+    if on_rule_file:
+        for rule_data in rule_files_content:
+            on_rule_file(rule_data)
+    return rule_files_content, rules_skipped
+
+
+def get_files_from_bitbucket(existing_rule_names, on_rule_file=None):
+    """
+    Fetches rule files from the specified directory in Bitbucket via API.
+    Files whose filename stem is in existing_rule_names are skipped before
+    their content is downloaded. If given, on_rule_file(rule_data) is called
+    for each rule in order as soon as its content is available, once the
+    directory listing has completed. Returns (rule_files_content, rules_skipped).
+    """
+    if BITBUCKET_FETCH_MODE == "archive":
+        return _get_files_from_bitbucket_archive(existing_rule_names, on_rule_file)
+
     logging.info(f"Fetching rule files from Bitbucket: {BITBUCKET_WORKSPACE}/{BITBUCKET_REPO_SLUG}/{RULES_DIR} @ {BITBUCKET_BRANCH_OR_COMMIT}")
     rule_files_content = []
-    list_url = f"{BITBUCKET_BASE_API_URL}/repositories/{BITBUCKET_WORKSPACE}/{BITBUCKET_REPO_SLUG}/src/{BITBUCKET_BRANCH_OR_COMMIT}/{RULES_DIR}"
+    # Built once; per-file content URLs are this prefix plus the file path
+    src_url = f"{BITBUCKET_BASE_API_URL}/repositories/{BITBUCKET_WORKSPACE}/{BITBUCKET_REPO_SLUG}/src/{BITBUCKET_BRANCH_OR_COMMIT}/"
+    list_url = f"{src_url}{RULES_DIR}"
+    session = get_bitbucket_session()
     page = 1
+    rules_skipped = 0
+    # (file_path, filename_stem, future) in listing order; content fetches run
+    # in the pool while the remaining listing pages are still being requested.
+    pending_fetches = []
+
+    with ThreadPoolExecutor(max_workers=BITBUCKET_FETCH_WORKERS) as executor:
+        submit = executor.submit
+        while list_url:
+            logging.debug(f"Fetching file list page: {list_url}")
+            response_data = _make_api_request(session, "GET", list_url)
+
+            if response_data is None or 'values' not in response_data:
+                logging.error(f"Failed to list files in Bitbucket directory: {RULES_DIR}. Check path, permissions, and branch/commit.")
+                for _, _, future in pending_fetches:
+                    future.cancel()
+                return None, rules_skipped
+
+            rule_file_paths = [item['path'] for item in response_data['values']
+                               if item.get('type') == 'commit_file' and item.get('path', '').endswith('.yaral')]
+            for file_path in rule_file_paths:
+                # filename_stem will be used as the target ruleName
+                filename_stem = _filename_stem(file_path)
+                logging.info(f"Found rule file: {file_path}")
+                if filename_stem in existing_rule_names:
+                    logging.info(f"Rule with matching ruleName '{filename_stem}' found in Chronicle. Skipping upload.")
+                    rules_skipped += 1
+                    continue
 
-    while list_url:
-        logging.debug(f"Fetching file list page: {list_url}")
-        response_data = _make_api_request("GET", list_url, headers=BITBUCKET_HEADERS)
+                future = submit(_fetch_rule_text, src_url + file_path)
+                pending_fetches.append((file_path, filename_stem, future))
 
-        if response_data is None or 'values' not in response_data:
-            logging.error(f"Failed to list files in Bitbucket directory: {RULES_DIR}. Check path, permissions, and branch/commit.")
-            return None
+            list_url = response_data.get('next')
+            page += 1
 
-        for item in response_data.get('values', []):
-            if item.get('type') == 'commit_file' and item.get('path', '').endswith('.yaral'):
-                file_path = item.get('path')
-                file_name = Path(file_path).name
-                # filename_stem will be used as the target ruleName
-                filename_stem = Path(file_name).stem
-                logging.info(f"Found rule file: {file_path}")
+        for file_path, filename_stem, future in pending_fetches:
+            rule_data = _append_rule_file(rule_files_content, file_path, filename_stem, future.result)
+            if rule_data is not None and on_rule_file:
+                on_rule_file(rule_data)
 
-                file_content_url = f"{BITBUCKET_BASE_API_URL}/repositories/{BITBUCKET_WORKSPACE}/{BITBUCKET_REPO_SLUG}/src/{BITBUCKET_BRANCH_OR_COMMIT}/{file_path}"
-                raw_content_headers = BITBUCKET_HEADERS.copy()
-                file_content_bytes = _make_api_request("GET", file_content_url, headers=raw_content_headers, stream=True)
-
-                if file_content_bytes:
-                    try:
-                        rule_text = file_content_bytes.decode('utf-8')
-                        if rule_text.strip():
-                             # Store the filename_stem as 'name' for matching
-                             rule_files_content.append({'name': filename_stem, 'text': rule_text, 'path': file_path})
-                             logging.debug(f"Successfully fetched content for {file_path}")
-                        else:
-                            logging.warning(f"Rule file '{file_path}' is empty. Skipping.")
-                    except UnicodeDecodeError:
-                         logging.error(f"Could not decode content of file '{file_path}' as UTF-8. Skipping.")
-                    except Exception as e:
-                         logging.error(f"Error processing content of file '{file_path}': {e}. Skipping.")
-                else:
-                    logging.error(f"Failed to fetch content for rule file: {file_path}")
+    logging.info(f"Finished fetching files from Bitbucket. Found {len(rule_files_content)} new rule files ({rules_skipped} already in Chronicle).")
+    return rule_files_content, rules_skipped
+
+
+# --- Chronicle ruleName Cache ---
+
+def _rule_names_cache_path():
+    """
+    Returns the path of the ruleName cache file, or None if caching is disabled.
+    The file name is keyed by the Chronicle API URL so pipelines targeting
+    different regions can share CI_CACHE_DIR without reading each other's names.
+    """
+    if not CI_CACHE_DIR:
+        return None
+    target_key = hashlib.sha256(CHRONICLE_BASE_API_URL.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CI_CACHE_DIR, f"chronicle_rules_{target_key}.json")
+
+
+def _rule_names_etag(rule_names):
+    """Returns a stable digest of a set of ruleNames, used to validate the cache file."""
+    return hashlib.sha256("\n".join(sorted(rule_names)).encode('utf-8')).hexdigest()
+
+
+def _read_rule_names_cache():
+    """Reads and validates the ruleName cache file. Returns (rule_names, ts) or None."""
+    cache_path = _rule_names_cache_path()
+    if not cache_path:
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            cache = _json_loads(f.read())
+        rule_names = set(cache['names'])
+        ts = float(cache['ts'])
+        target = cache['target']
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"Ignoring unreadable ruleName cache '{cache_path}': {e}")
+        return None
+    if target != CHRONICLE_BASE_API_URL:
+        logging.warning(f"Ignoring ruleName cache '{cache_path}': it was written for {target}, not {CHRONICLE_BASE_API_URL}.")
+        return None
+    if cache.get('etag') != _rule_names_etag(rule_names):
+        logging.warning(f"Ignoring ruleName cache '{cache_path}': etag does not match its contents.")
+        return None
+    return rule_names, ts
 
-        list_url = response_data.get('next')
-        page += 1
 
-    logging.info(f"Finished fetching files from Bitbucket. Found {len(rule_files_content)} rule files.")
-    return rule_files_content
+def _write_rule_names_cache(rule_names, ts):
+    """Writes the ruleName cache file atomically. Does nothing if caching is disabled."""
+    cache_path = _rule_names_cache_path()
+    if not cache_path:
+        return
+    cache = {"target": CHRONICLE_BASE_API_URL, "etag": _rule_names_etag(rule_names), "names": sorted(rule_names), "ts": ts}
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        os.makedirs(CI_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(_json_dumps(cache))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Failed to write ruleName cache '{cache_path}': {e}")
 
 
+def add_rule_names_to_cache(rule_names):
+    """
+    Adds newly uploaded ruleNames to the cache file, keeping its original
+    timestamp so the TTL still measures time since the last full listing.
+    """
+    cached = _read_rule_names_cache()
+    if cached is not None:
+        cached_names, ts = cached
+        _write_rule_names_cache(cached_names | set(rule_names), ts)
+
+
+def invalidate_rule_names_cache():
+    """
+    Deletes the cache file so the next run lists ruleNames from Chronicle.
+    Used when an upload failed, since Chronicle may still have created the rule.
+    """
+    cache_path = _rule_names_cache_path()
+    if not cache_path:
+        return
+    try:
+        os.remove(cache_path)
+        logging.info(f"Removed ruleName cache '{cache_path}' because an upload failed.")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Failed to remove ruleName cache '{cache_path}': {e}")
+
 # --- Chronicle API Functions (Using v2 API) ---
 
-def get_existing_rule_names():
+def get_existing_rule_names(use_cache=True):
     """
     Retrieves rules from Chronicle, logs counts, and returns a set of
-    ruleName values found for matching purposes.
+    ruleName values found for matching purposes. A cached listing younger
+    than CACHE_TTL seconds is used instead when CI_CACHE_DIR is set, unless
+    use_cache is False. A fresh listing is always written back to the cache.
     """
+    cached = _read_rule_names_cache() if use_cache else None
+    if cached is not None:
+        cached_names, ts = cached
+        age = time.time() - ts
+        if 0 <= age < CACHE_TTL:
+            logging.info(f"Using {len(cached_names)} cached Chronicle ruleNames ({age:.0f}s old, TTL {CACHE_TTL}s).")
+            return cached_names
+        logging.info(f"Cached Chronicle ruleNames are {age:.0f}s old (TTL {CACHE_TTL}s). Refreshing from Chronicle.")
+
     existing_rule_names_set = set()
     total_rules_found_api = 0
     rules_with_rule_name = 0
-    next_page_token = None
     endpoint = "detect/rules"
     logging.info(f"Fetching existing rules from Chronicle v2 ({endpoint})...")
     url = f"{CHRONICLE_BASE_API_URL}/{endpoint}"
+    fetched_at = time.time()
+    listing_complete = True
 
     page_num = 1
-    while True:
+    # Request page N+1 as soon as page N's token is known, so the next round
+    # trip overlaps with processing the current page's rules.
+    with ThreadPoolExecutor(max_workers=1) as executor:
         logging.debug(f"Fetching page {page_num} of existing rules...")
-        params = {}
-        if next_page_token:
-            params['pageToken'] = next_page_token
-
-        response_data = _make_api_request("GET", url, headers=CHRONICLE_HEADERS, params=params)
-
-        if response_data is None:
-            if page_num == 1:
-                 logging.error("Failed to retrieve initial page of rules from Chronicle.")
-                 return None
-            else:
-                 logging.error(f"Failed to retrieve page {page_num} of rules from Chronicle. Proceeding with previously fetched data.")
-                 break
-
-        rules = response_data.get('rules', [])
-        total_rules_found_api += len(rules)
-
-        for rule in rules:
-            rule_name_from_api = rule.get('ruleName')
-            if rule_name_from_api:
-                existing_rule_names_set.add(rule_name_from_api)
-                rules_with_rule_name += 1
-            else:
-                rule_id = rule.get('ruleId', rule.get('id', 'Unknown ID'))
-                logging.warning(f"Chronicle rule found without a ruleName (ID: {rule_id}). This rule cannot be matched by filename.")
-
-        next_page_token = response_data.get('nextPageToken')
-        if not next_page_token:
-            break
-        page_num += 1
+        page_future = executor.submit(_make_api_request, get_chronicle_session(), "GET", url, params={})
+        while page_future is not None:
+            response_data = page_future.result()
+            page_future = None
+
+            if response_data is None:
+                if page_num == 1:
+                     logging.error("Failed to retrieve initial page of rules from Chronicle.")
+                     return None
+                else:
+                     logging.error(f"Failed to retrieve page {page_num} of rules from Chronicle. Proceeding with previously fetched data.")
+                     listing_complete = False
+                     break
+
+            next_page_token = response_data.get('nextPageToken')
+            if next_page_token:
+                logging.debug(f"Fetching page {page_num + 1} of existing rules...")
+                page_future = executor.submit(_make_api_request, get_chronicle_session(), "GET", url, params={'pageToken': next_page_token})
+
+            rules = response_data.get('rules', [])
+            total_rules_found_api += len(rules)
+
+            for rule in rules:
+                rule_name_from_api = rule.get('ruleName')
+                if rule_name_from_api:
+                    existing_rule_names_set.add(rule_name_from_api)
+                    rules_with_rule_name += 1
+                else:
+                    rule_id = rule.get('ruleId', rule.get('id', 'Unknown ID'))
+                    logging.warning(f"Chronicle rule found without a ruleName (ID: {rule_id}). This rule cannot be matched by filename.")
+
+            page_num += 1
 
     logging.info(f"Chronicle API returned {total_rules_found_api} total rules.")
     logging.info(f"Found {rules_with_rule_name} rules with ruleNames for matching.")
+    # Never cache a partial listing
+    if listing_complete:
+        _write_rule_names_cache(existing_rule_names_set, fetched_at)
     return existing_rule_names_set
 
 
@@ -194,7 +576,7 @@ def verify_rule(target_rule_name, rule_text):
     # Keep simple payload unless :verifyRule confirmed to need full object
     payload = {"rule_text": rule_text}
 
-    response_data = _make_api_request("POST", url, headers=CHRONICLE_HEADERS, json_data=payload, expected_status=200)
+    response_data = _make_api_request(get_chronicle_session(), "POST", url, json_data=payload, expected_status=200)
 
     if response_data is not None:
         logging.info(f"Rule syntax for '{target_rule_name}' verified successfully by Chronicle v2.")
@@ -205,7 +587,10 @@ def verify_rule(target_rule_name, rule_text):
 
 
 def upload_rule(target_rule_name, rule_text):
-    """Uploads a new rule using the Chronicle v2 createRule endpoint, setting ruleName."""
+    """
+    Uploads a new rule using the Chronicle v2 createRule endpoint, setting ruleName.
+    Returns 'uploaded', 'invalid' (Chronicle rejected the rule text) or 'failed'.
+    """
     logging.info(f"Uploading rule to Chronicle v2 as '{target_rule_name}'...")
     endpoint = "detect/rules"
     url = f"{CHRONICLE_BASE_API_URL}/{endpoint}"
@@ -217,91 +602,202 @@ def upload_rule(target_rule_name, rule_text):
         # "metadata": {"description": "Uploaded via CI/CD"}
         }
 
-    response_data = _make_api_request("POST", url, headers=CHRONICLE_HEADERS, json_data=payload, expected_status=200)
+    # createRule validates the rule text itself and answers 400 INVALID_ARGUMENT if it is invalid
+    response_data = _make_api_request(get_chronicle_session(), "POST", url, json_data=payload, expected_status=200, passthrough_statuses=(400,))
 
     if response_data is not None and ('ruleId' in response_data or 'id' in response_data):
         rule_id = response_data.get('ruleId', response_data.get('id'))
         logging.info(f"Rule '{target_rule_name}' uploaded successfully to Chronicle v2. Rule ID: {rule_id}")
-        return True
+        return 'uploaded'
+
+    log_detail = f" Response: {_json_dumps(response_data).decode('utf-8')}" if response_data else ""
+    error = response_data.get('error') if isinstance(response_data, dict) else None
+    if isinstance(error, dict) and error.get('status') == 'INVALID_ARGUMENT':
+        logging.error(f"Rule '{target_rule_name}' was rejected as invalid by Chronicle v2.{log_detail}")
+        return 'invalid'
+    logging.error(f"Rule '{target_rule_name}' upload failed with Chronicle v2.{log_detail}")
+    return 'failed'
+
+def _rule_text_digest(rule_text):
+    """Returns a short content digest of rule_text, used to detect byte-identical rule files."""
+    return hashlib.blake2b(rule_text.encode('utf-8'), digest_size=16).digest()
+
+
+# Guards the verify_results dict shared by concurrent deploy_rule calls
+_verify_results_lock = threading.Lock()
+
+def verify_rule_cached(target_rule_name, rule_text, verify_results):
+    """
+    Verifies a rule, sharing the result between rules with byte-identical text.
+    verify_results maps content digest -> Future of the verify_rule result and
+    should be created once per run. Concurrent callers with the same text wait
+    for the first caller's verify request instead of sending their own.
+    """
+    digest = _rule_text_digest(rule_text)
+    with _verify_results_lock:
+        result_future = verify_results.get(digest)
+        is_first = result_future is None
+        if is_first:
+            result_future = verify_results[digest] = Future()
+    if is_first:
+        try:
+            result_future.set_result(verify_rule(target_rule_name, rule_text))
+        except BaseException as e:
+            result_future.set_exception(e)
+            raise
     else:
-        log_detail = f" Response: {json.dumps(response_data)}" if response_data else ""
-        logging.error(f"Rule '{target_rule_name}' upload failed with Chronicle v2.{log_detail}")
-        return False
+        logging.info(f"Rule '{target_rule_name}' has identical content to an already verified rule. Reusing its verification result.")
+    return result_future.result()
+
+
+def deploy_rule(rule_data, verify_results=None):
+    """
+    Verifies and uploads a single new rule. Returns 'uploaded',
+    'failed_verification' or 'failed_upload'. Unless SKIP_PRE_VERIFY is
+    disabled, the separate verifyRule call is skipped and a rule rejected as
+    invalid by createRule counts as a verification failure. If given,
+    verify_results is passed to verify_rule_cached so identical rule texts
+    are verified only once.
+    """
+    target_rule_name = rule_data['name']
+    rule_text = rule_data['text']
+    rule_path = rule_data['path']
+    logging.info(f"Processing rule from Bitbucket path: {rule_path} (Target ruleName: {target_rule_name})")
+    if SKIP_PRE_VERIFY:
+        logging.info(f"No rule with ruleName '{target_rule_name}' found in existing Chronicle rules. Proceeding with upload.")
+    else:
+        logging.info(f"No rule with ruleName '{target_rule_name}' found in existing Chronicle rules. Proceeding with verification.")
+        # Pass rule_text to verify_rule
+        if verify_results is not None:
+            verified = verify_rule_cached(target_rule_name, rule_text, verify_results)
+        else:
+            verified = verify_rule(target_rule_name, rule_text)
+        if not verified:
+            return 'failed_verification'
+    # Pass target_rule_name and rule_text to upload_rule
+    upload_result = upload_rule(target_rule_name, rule_text)
+    if upload_result == 'uploaded':
+        return 'uploaded'
+    if upload_result == 'invalid' and SKIP_PRE_VERIFY:
+        return 'failed_verification'
+    return 'failed_upload'
 
 # --- Main Pipeline Logic ---
 
-def main():
-    """Executes the CI/CD pipeline steps."""
+# Exit codes returned by main()
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1 # A fetch aborted or an upload failed; may be transient, so worth retrying
+EXIT_INVALID_RULES = 2 # Only rules rejected as invalid failed; retrying cannot help
+
+def main(use_cache=True):
+    """
+    Executes the CI/CD pipeline steps and returns the process exit code.
+    With use_cache=False the existing ruleNames are always listed from
+    Chronicle, ignoring any cached listing.
+    """
+    configure()
     logging.info("--- Starting Chronicle Rule Deployment Pipeline (API v2 - using ruleName) ---")
 
     # 1. Get existing rule names from Chronicle
     logging.info("--- Step 1: Get Existing Rule Names (Chronicle v2) ---")
-    existing_rule_names = get_existing_rule_names()
+    existing_rule_names = get_existing_rule_names(use_cache=use_cache)
     if existing_rule_names is None:
         logging.error("Failed to get initial rule data from Chronicle. Aborting.")
-        exit(1)
+        return EXIT_FAILURE
+    existing_rule_names = frozenset(existing_rule_names)
     logging.info(f"Using {len(existing_rule_names)} ruleNames for existence checks.")
 
 
-    # 2. Fetch rules from Bitbucket
-    logging.info(f"--- Step 2: Fetch Rules from Bitbucket Repository ---")
-    rules_from_bitbucket = get_files_from_bitbucket()
-    if rules_from_bitbucket is None:
-        logging.error("Failed to fetch rules from Bitbucket. Aborting.")
-        exit(1)
-    if not rules_from_bitbucket:
-        logging.warning(f"No '.yaral' rule files found in Bitbucket directory '{RULES_DIR}'. Exiting.")
-        exit(0)
-
-    # 3. Process and Upload rules
-    logging.info(f"--- Step 3: Verify and Upload Rules to Chronicle v2 ---")
-    rules_processed = 0
-    rules_uploaded = 0
-    rules_skipped = 0
-    rules_failed_verification = 0
-    rules_failed_upload = 0
-
-    for rule_data in rules_from_bitbucket:
-        rules_processed += 1
-        target_rule_name = rule_data['name']
-        rule_text = rule_data['text']
-        rule_path = rule_data['path']
-        logging.info(f"Processing rule from Bitbucket path: {rule_path} (Target ruleName: {target_rule_name})")
-
-        if target_rule_name in existing_rule_names:
-            logging.info(f"Rule with matching ruleName '{target_rule_name}' found in Chronicle. Skipping upload.")
-            rules_skipped += 1
-        else:
-            logging.info(f"No rule with ruleName '{target_rule_name}' found in existing Chronicle rules. Proceeding with verification.")
-            # Pass rule_text to verify_rule
-            if verify_rule(target_rule_name, rule_text):
-                 # Pass target_rule_name and rule_text to upload_rule
-                if upload_rule(target_rule_name, rule_text):
-                    rules_uploaded += 1
-                else:
-                    rules_failed_upload += 1
-            else:
-                rules_failed_verification += 1
+    # 2. Fetch new rules from Bitbucket (rules already in Chronicle are skipped
+    #    before download) and verify/upload them. Each rule's verify -> upload
+    #    chain is independent, so they run concurrently, and each is submitted
+    #    as soon as its content arrives so uploads overlap with the remaining
+    #    Bitbucket downloads.
+    logging.info("--- Step 2: Fetch Rules from Bitbucket and Verify/Upload New Rules to Chronicle v2 ---")
+    with ThreadPoolExecutor(max_workers=CHRONICLE_DEPLOY_WORKERS) as deploy_executor:
+        # (rule_data, future) for every rule submitted for verify/upload
+        deployments = []
+        # Verify results for this run, shared by rule files with identical content
+        verify_results = {}
+
+        def submit_rule(rule_data):
+            deployments.append((rule_data, deploy_executor.submit(deploy_rule, rule_data, verify_results)))
+
+        rules_from_bitbucket, rules_skipped = get_files_from_bitbucket(
+            existing_rule_names,
+            on_rule_file=submit_rule,
+        )
+        if rules_from_bitbucket is None:
+            logging.error("Failed to fetch rules from Bitbucket. Aborting.")
+            return EXIT_FAILURE
+        if not rules_from_bitbucket and not rules_skipped:
+            logging.warning(f"No '.yaral' rule files found in Bitbucket directory '{RULES_DIR}'. Exiting.")
+            return EXIT_SUCCESS
+
+        outcomes = [future.result() for _, future in deployments]
+
+    rules_processed = rules_skipped + len(rules_from_bitbucket)
+    rules_uploaded = outcomes.count('uploaded')
+    rules_failed_verification = outcomes.count('failed_verification')
+    rules_failed_upload = outcomes.count('failed_upload')
+
+    summary_counts = {
+        "processed": rules_processed,
+        "skipped_existing": rules_skipped,
+        "uploaded": rules_uploaded,
+        "failed_verification": rules_failed_verification,
+        "failed_upload": rules_failed_upload,
+    }
+    # Emitted as one record: readable lines, a key=value line for CI log
+    # parsing, and the counts in extra={'summary': ...} for structured handlers.
+    summary_lines = [
+        "--- Rule Upload Summary ---",
+        f"Rule files processed from Bitbucket: {rules_processed}",
+        f"Rules skipped (matching ruleName found in Chronicle): {rules_skipped}",
+        f"Rules successfully verified and uploaded to Chronicle: {rules_uploaded}",
+        f"Rules failed Chronicle verification: {rules_failed_verification}",
+        f"Rules failed Chronicle upload (after verification): {rules_failed_upload}",
+        "Summary: " + " ".join(f"{key}={value}" for key, value in summary_counts.items()),
+    ]
+    logging.info("\n".join(summary_lines), extra={"summary": summary_counts})
+
+    # 3. Count post-run rules from the Step 1 listing plus this run's uploads,
+    #    rather than paging through the whole Chronicle inventory again
+    logging.info("--- Step 3: Get Final Rule Counts (Chronicle v2) ---")
+    uploaded_rule_names = {rule_data['name'] for (rule_data, _), outcome in zip(deployments, outcomes) if outcome == 'uploaded'}
+    if rules_failed_upload > 0:
+        invalidate_rule_names_cache()
+    else:
+        add_rule_names_to_cache(uploaded_rule_names)
+    logging.info(f"Chronicle now has {len(existing_rule_names | uploaded_rule_names)} ruleNames for matching ({len(uploaded_rule_names)} added this run).")
 
-    logging.info("--- Rule Upload Summary ---")
-    logging.info(f"Rule files processed from Bitbucket: {rules_processed}")
-    logging.info(f"Rules skipped (matching ruleName found in Chronicle): {rules_skipped}")
-    logging.info(f"Rules successfully verified and uploaded to Chronicle: {rules_uploaded}")
-    logging.info(f"Rules failed Chronicle verification: {rules_failed_verification}")
-    logging.info(f"Rules failed Chronicle upload (after verification): {rules_failed_upload}")
 
-    # 4. Count post-run rules in Chronicle (Optional final check)
-    logging.info("--- Step 4: Get Final Rule Counts (Chronicle v2) ---")
-    get_existing_rule_names()
+    logging.info("--- Chronicle Rule Deployment Pipeline Finished ---")
 
+    if rules_failed_upload > 0:
+        return EXIT_FAILURE
+    if rules_failed_verification > 0:
+        return EXIT_INVALID_RULES
+    return EXIT_SUCCESS
 
-    logging.info("--- Chronicle Rule Deployment Pipeline Finished ---")
 
-    if rules_failed_verification > 0 or rules_failed_upload > 0:
-        exit(1)
-    else:
-        exit(0)
+def run_with_retry(attempts=3):
+    """
+    Runs main() up to `attempts` times with exponential backoff, retrying only
+    failures that may be transient. Reruns stay in-process, so sessions and
+    their pooled connections are reused. Returns the last exit code.
+    """
+    for attempt in range(attempts):
+        # createRule is not idempotent and a failed upload may still have
+        # created the rule, so retries must re-list from Chronicle rather than
+        # trust a cached listing that cannot contain it.
+        exit_code = main(use_cache=(attempt == 0))
+        if exit_code != EXIT_FAILURE or attempt == attempts - 1:
+            return exit_code
+        delay = 2 ** attempt
+        logging.warning(f"Deployment attempt {attempt + 1} of {attempts} failed. Retrying in {delay}s...")
+        time.sleep(delay)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(run_with_retry())